@@ -290,7 +290,7 @@ class HttpRequest(BaseRequest):
         is reached (default 10MiB), raises an ``IOError``.
         """
         body = await self.get_body(limit)
-        return json.loads(body.decode())
+        return json.loads(body)  # json accepts utf-8 bytes
 
 
 class WebsocketRequest(BaseRequest):
@@ -397,9 +397,7 @@ class WebsocketRequest(BaseRequest):
         Raises ``DisconnectedError`` when the client closed the connection.
         """
         result = await self.receive()
-        if isinstance(result, bytes):
-            result = result.decode()
-        return json.loads(result)
+        return json.loads(result)  # works for both str and bytes
 
     async def close(self, code=1000):
         """Async function to close the websocket connection."""
@@ -5,8 +5,12 @@ Asgineer test utilities.
 import os
 import sys
 import time
+import signal
+import socket
 import inspect
 import asyncio
+import functools
+import itertools
 import tempfile
 import subprocess
 from collections import namedtuple
@@ -14,6 +18,7 @@ from wsgiref.handlers import format_date_time
 from urllib.parse import unquote, urlparse
 
 import requests
+from requests.structures import CaseInsensitiveDict
 
 import asgineer
 
@@ -51,6 +56,7 @@ class BaseTestServer:
         self._app = app
         self._server = server_description
         self._loop = asyncio.get_event_loop() if loop is None else loop
+        self._raw_out = ""
         self._out = ""
         # Get stdout funcs because the mock server hijacks them
         self._stdout_write = sys.stdout.write
@@ -71,10 +77,14 @@ class BaseTestServer:
         """The stdout / stderr of the server. This gets set when the
         with-statement using this object exits.
         """
+        # Filter lazily; many tests don't look at the output
+        if self._out is None:
+            self._out = "\n".join(self.filter_lines(self._raw_out.splitlines()))
         return self._out
 
     def __enter__(self):
         self.log(f"  Create {self._server} server .. ", end="")
+        self._raw_out = ""
         self._out = ""
         t0 = time.time()
 
@@ -87,8 +97,8 @@ class BaseTestServer:
         self.log("- Closing .. " if exc_value is None else "Error .. ", end="")
         t0 = time.time()
 
-        out = self._stop_server()
-        self._out = "\n".join(self.filter_lines(out.splitlines()))
+        self._raw_out = self._stop_server()
+        self._out = None
 
         if exc_value is None:
             self.log(f" {time.time()-t0:0.1f}s ")
@@ -114,11 +124,12 @@ class BaseTestServer:
 
     def request(self, method, path, data=None, headers=None, **kwargs):
         """Send a request to the server. Returns a named tuple ``(status, headers, body)``.
+        The headers are a case-insensitive dict.
 
         Arguments:
             method (str): the HTTP method (e.g. "GET")
             path (str): path or url (also see the ``url`` property).
-            data: the bytes to send (optional).
+            data: the bytes to send, or an iterable of bytes to send in chunks (optional).
             headers: headers to send (optional).
             kwargs: additional arguments to pass to ``requests.request()``.
 
@@ -142,9 +153,9 @@ class BaseTestServer:
         a ws object as an argument, which has methods ``send``, ``receive`` and
         ``close``, and it can be iterated over. Messages are either str or bytes.
         """
-        url = self.url.replace("http", "ws") + "/" + path.lstrip("/")
+        url = self.url.replace("http", "ws", 1) + "/" + path.lstrip("/")
         if loop is None:
-            loop = asyncio.get_event_loop()
+            loop = self._loop
         co = self._co_ws_communicate(url, client_co_func, loop)
         return loop.run_until_complete(co)
 
@@ -169,6 +180,7 @@ import _thread
 import asgineer
 
 def closer():
+    # Windows cannot send SIGINT to a subprocess, so watch the file instead
     while os.path.isfile(__file__):
         time.sleep(0.01)
     _thread.interrupt_main()
@@ -184,7 +196,10 @@ async def proxy_app(scope, receive, send):
         return await app(scope, receive, send)
 
 if __name__ == "__main__":
-    threading.Thread(target=closer).start()
+    # Line-buffered, so that handlers' prints end up in the output, even if killed
+    sys.stdout.reconfigure(line_buffering=True)
+    if sys.platform.startswith("win"):
+        threading.Thread(target=closer).start()
     asgineer.run("__main__:proxy_app", "ASGISERVER", "localhost:PORT")
     sys.stderr.flush()
     sys.stdout.flush()
@@ -204,6 +219,31 @@ def load_module(name, filename):
 """
 
 
+def _can_connect(host, port):
+    """Get whether a TCP connection can be made to the given address."""
+    try:
+        with socket.create_connection((host, port), timeout=1) as sock:
+            # Our port is in the ephemeral range, so the OS may pick it as
+            # the source port, resulting in a connection to ourselves.
+            return sock.getsockname() != sock.getpeername()
+    except OSError:
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def _get_source(code):
+    """Get the (unindented) source of a function from its code object.
+    Cached, because tests often start servers for the same handler.
+    """
+    sourcelines = inspect.getsourcelines(code)[0]
+    # Dedent by the indent of the def, so that lines in multi-line
+    # strings that are less indented (and blank lines) are kept as-is.
+    indent = sourcelines[0][: inspect.indentsize(sourcelines[0])]
+    return "".join(
+        line[len(indent) :] if line.startswith(indent) else line for line in sourcelines
+    )
+
+
 class ProcessTestServer(BaseTestServer):
     """Subclass of BaseTestServer that runs an actual server in a
     subprocess. The ``server`` argument must be a server supported by
@@ -241,9 +281,7 @@ class ProcessTestServer(BaseTestServer):
         else:
             # Likely a app defined inside a function. Get app from sourece code.
             # This will not work if the app has dependencies.
-            sourcelines = inspect.getsourcelines(app)[0]
-            indent = inspect.indentsize(sourcelines[0])
-            code = "\n".join(line[indent:] for line in sourcelines)
+            code = _get_source(app.__code__)
             code = code.replace("def " + app.__name__, f"def {name2}")
 
         if is_handler:
@@ -256,50 +294,69 @@ class ProcessTestServer(BaseTestServer):
         code = code.replace("app = APP", self._app_code)
         with open(testfilename, "wb") as f:
             f.write((code).encode())
-        # Start server, clean up the temp filename on failure since __exit__ wont be called.
+        # Start server, clean up on failure since __exit__ wont be called.
+        self._p = self._outfile = None
         try:
             self._start_subprocess()
         except Exception as err:
             self._delfile()
+            if self._p is not None:
+                self._stop_subprocess()
+            if self._outfile is not None:
+                self._outfile.close()
             raise err
 
     def _start_subprocess(self):
         # Start subprocess. Don't use stdin; it breaks multiprocessing somehow!
+        # Output goes to a file, so that a chatty server cannot fill up a pipe
+        # buffer and block, since we only read the output at the end.
+        self._outfile = tempfile.TemporaryFile()
         self._p = subprocess.Popen(
             [sys.executable, testfilename],
-            stdout=subprocess.PIPE,
+            stdout=self._outfile,
             stderr=subprocess.STDOUT,
         )
-        # Wait for process to start, and make sure it is not dead
+        # Wait for the server to accept connections, and make sure it is not dead
         while self._p.poll() is None:
-            time.sleep(0.02)
-            try:
-                requests.get(URL + "/specialtestpath/init", timeout=0.01)
+            if _can_connect("127.0.0.1", PORT):
                 break
-            except (requests.ConnectionError, requests.ReadTimeout):
-                pass
+            time.sleep(0.005)
         if self._p.poll() is not None:
-            raise RuntimeError(
-                "Process failed to start!\n" + self._p.stdout.read().decode()
-            )
+            raise RuntimeError("Process failed to start!\n" + self._read_output())
+        # Make sure the app is loaded and responding. The session keeps
+        # connections alive, so the requests of a test can reuse them.
+        self._session = requests.Session()
+        self._session.get(URL + "/specialtestpath/init", timeout=5)
 
     def _stop_server(self):
-        # Ask process to stop
+        # Close connections, then stop the process
+        self._session.close()
         self._delfile()
-        # Force it to stop if needed
-        for i in range(5):
-            etime = time.time() + 5
-            while self._p.poll() is None and time.time() < etime:
-                time.sleep(0.01)
-            if self._p.poll() is not None:
-                break
-            self._p.terminate()
-        else:
-            raise RuntimeError("Runaway server process failed to terminate!")
+        self._stop_subprocess()
         if self._p.poll():
             self.log(f"nonzero exit code {self._p.poll()}")
         # Get output
-        return self._p.stdout.read().decode(errors="ignore")
+        return self._read_output()
+
+    def _stop_subprocess(self):
+        # Ask process to stop (on Windows it watches the file)
+        if not sys.platform.startswith("win"):
+            self._p.send_signal(signal.SIGINT)
+        # Force it to stop if needed
+        try:
+            self._p.wait(5)
+        except subprocess.TimeoutExpired:
+            self._p.terminate()
+            try:
+                self._p.wait(5)
+            except subprocess.TimeoutExpired:
+                self._p.kill()
+                self._p.wait(5)
+
+    def _read_output(self):
+        with self._outfile as f:
+            f.seek(0)
+            return f.read().decode(errors="ignore")
 
     def _delfile(self):
         try:
@@ -308,7 +365,7 @@ class ProcessTestServer(BaseTestServer):
             pass
 
     async def _co_request(self, method, url, **kwargs):
-        r = requests.request(method, url, **kwargs)
+        r = self._session.request(method, url, **kwargs)
         return r.status_code, r.headers, r.content
 
     async def _co_ws_communicate(self, url, client_co_func, loop):
@@ -355,6 +412,7 @@ class MockTestServer(BaseTestServer):
         try:
             self._lifespan_messages = []
             self._lifespan_completes = []
+            self._lifespan_future = None
             self._lifespan_task = self._make_lifespan_task()
             self._wait_for_lifespan_complete("startup")
         except Exception as err:
@@ -374,17 +432,27 @@ class MockTestServer(BaseTestServer):
             self._restore_streams()
         return "".join(self._out_writes)
 
+    def _lifespan_changed(self):
+        """Get a future that resolves when a lifespan message is added or sent."""
+        if self._lifespan_future is None or self._lifespan_future.done():
+            self._lifespan_future = self._loop.create_future()
+        return self._lifespan_future
+
+    def _notify_lifespan(self):
+        if self._lifespan_future is not None and not self._lifespan_future.done():
+            self._lifespan_future.set_result(None)
+
     def _make_lifespan_task(self):
         scope = {"type": "lifespan"}
 
         async def receive():
-            while True:
-                if self._lifespan_messages:
-                    return self._lifespan_messages.pop(0)
-                await asyncio.sleep(0.02)
+            while not self._lifespan_messages:
+                await self._lifespan_changed()
+            return self._lifespan_messages.pop(0)
 
         async def send(m):
             self._lifespan_completes.append(m["type"])
+            self._notify_lifespan()
 
         return self._loop.create_task(self._asgi_app(scope, receive, send))
 
@@ -402,9 +470,12 @@ class MockTestServer(BaseTestServer):
                     raise RuntimeError(
                         f"Timeout for {what}, has {self._lifespan_completes}"
                     )
-                await asyncio.sleep(0.02)
+                # Wait for the app to respond, instead of polling
+                waitables = [self._lifespan_changed(), self._lifespan_task]
+                await asyncio.wait(waitables, timeout=max(0, etime - time.time()))
 
         self._lifespan_messages.append({"type": f"lifespan.{what}"})
+        self._notify_lifespan()
         self._loop.run_until_complete(waiter())
 
     def _make_scope(self, request):
@@ -468,14 +539,19 @@ class MockTestServer(BaseTestServer):
 
         client_to_server = []
         server_to_client = []
-        if p.body is not None:
-            client_to_server.append(p.body)
+        if p.body is None:
+            body_chunks = iter([b""])
+        elif isinstance(p.body, (bytes, str)):
+            body_chunks = iter([p.body])
         else:
-            client_to_server.append(b"")
+            body_chunks = iter(p.body)  # streamed body, e.g. a generator
+        client_to_server.append(next(body_chunks, b""))
 
         async def receive():
             if client_to_server:
                 chunk = client_to_server.pop(0)
+                # Pull the next chunk, so we know whether there is more
+                client_to_server.extend(itertools.islice(body_chunks, 1))
                 return {
                     "type": "http.request",
                     "body": chunk,
@@ -493,7 +569,9 @@ class MockTestServer(BaseTestServer):
 
         async def send(m):
             if m["type"] == "http.response.start":
-                headers = dict((h[0].decode(), h[1].decode()) for h in m["headers"])
+                headers = CaseInsensitiveDict(
+                    (h[0].decode(), h[1].decode()) for h in m["headers"]
+                )
                 headers.setdefault("date", format_date_time(time.time()))
                 headers.setdefault("server", "asgineer_mock_server")
                 response.extend([m["status"], headers])
@@ -505,7 +583,7 @@ class MockTestServer(BaseTestServer):
         response = []
         await self._asgi_app(scope, receive, send)
         if not response:
-            response.extend([9999, {}])
+            response.extend([9999, CaseInsensitiveDict()])
         response.append(b"".join(server_to_client))
 
         return tuple(response)
@@ -519,16 +597,15 @@ class MockTestServer(BaseTestServer):
 
         # ---
 
-        client_to_server = []
-        server_to_client = []
+        # Queues wake up the receiving side directly, instead of polling
+        client_to_server = asyncio.Queue()
+        server_to_client = asyncio.Queue()
 
         async def receive():
-            while not client_to_server:
-                await asyncio.sleep(0.02)
-            return client_to_server.pop(0)
+            return await client_to_server.get()
 
         async def send(m):
-            server_to_client.append(m)
+            server_to_client.put_nowait(m)
 
         class WS:
             def __init__(self):
@@ -544,16 +621,14 @@ class MockTestServer(BaseTestServer):
                     m = {"type": "websocket.receive", "text": value}
                 else:
                     raise TypeError("Can only send bytes/str.")
-                client_to_server.append(m)
+                client_to_server.put_nowait(m)
 
             async def receive(self):
                 # Wait for message to become available
                 if self._closed_server:
                     raise IOError("WS is closed")
-                while not server_to_client:
-                    await asyncio.sleep(0.02)
-                # Get message and handle special cases
-                m = server_to_client.pop(0)
+                m = await server_to_client.get()
+                # Handle special cases
                 if m["type"] in ("websocket.disconnect", "websocket.close"):
                     self._closed_server = True
                     raise IOError("WS closed")
@@ -564,7 +639,7 @@ class MockTestServer(BaseTestServer):
                 return m.get("bytes", None) or m.get("text", None) or b""
 
             async def close(self):
-                client_to_server.append({"type": "websocket.disconnect"})
+                client_to_server.put_nowait({"type": "websocket.disconnect"})
 
             async def __aiter__(self):
                 while True:
@@ -574,8 +649,8 @@ class MockTestServer(BaseTestServer):
                         return
 
         loop.create_task(self._asgi_app(scope, receive, send))
-        client_to_server.append({"type": "websocket.connect"})
+        client_to_server.put_nowait({"type": "websocket.connect"})
         ws = WS()
         result = await client_co_func(ws)
-        client_to_server.append({"type": "websocket.disconnect"})
+        client_to_server.put_nowait({"type": "websocket.disconnect"})
         return result
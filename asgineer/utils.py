@@ -3,6 +3,7 @@ Some utilities for common tasks.
 """
 
 import gzip
+import zlib
 import hashlib
 import mimetypes
 
@@ -71,7 +72,9 @@ def make_asset_handler(assets, max_age=0, min_compress_size=256):
     * If the asset is over ``min_compress_size`` bytes, is not a video, the
       request has a ``accept-encoding`` header that contains "gzip",
       and the compressed data is less that 90% of the raw data, the
-      data is send in compressed form.
+      data is send in compressed form. For large assets (128 KiB and up),
+      two 32 KiB samples are compressed first, to avoid compressing data
+      that is already compressed (e.g. images).
     """
 
     if not isinstance(assets, dict):
@@ -100,7 +103,7 @@ def make_asset_handler(assets, max_age=0, min_compress_size=256):
         unzipped[lpath] = bbody
         # Store zipped body if it makes sense
         if len(bbody) >= min_compress_size:
-            if not lpath.endswith(VIDEO_EXTENSIONS):
+            if not lpath.endswith(VIDEO_EXTENSIONS) and _may_compress(bbody):
                 bbody_zipped = gzip.compress(bbody)
                 if len(bbody_zipped) < 0.90 * len(bbody):
                     zipped[lpath] = bbody_zipped
@@ -158,3 +161,19 @@ def make_asset_handler(assets, max_age=0, min_compress_size=256):
         return status, headers, body
 
     return asset_handler
+
+
+def _may_compress(bbody, sample_size=32768):
+    """Get whether compressing the given bytes may be worthwhile, based on
+    a fast compression of two samples. Only large bodies are sampled. The
+    samples span deflate's 32 KiB window, so that repeats which gzip can
+    exploit also show up in a sample.
+    """
+    if len(bbody) < 4 * sample_size:
+        return True
+    # Sample from the start and the middle, because of e.g. file headers
+    i = len(bbody) // 2
+    for sample in (bbody[:sample_size], bbody[i : i + sample_size]):
+        if len(zlib.compress(sample, 1)) < 0.95 * sample_size:
+            return True
+    return False
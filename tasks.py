@@ -29,15 +29,23 @@ if not os.path.isdir(os.path.join(ROOT_DIR, LIBNAME)):
 
 
 @task
-def tests(ctx, server="mock", cover=False):
-    """Perform unit tests. Use --cover to open a webbrowser to show coverage."""
+def tests(ctx, server="mock", cover=False, parallel=False, fast=False):
+    """Perform unit tests. Use --cover to open a webbrowser to show coverage.
+    Use --parallel to distribute the tests over multiple processes (needs pytest-xdist).
+    Use --fast to skip the tests that are marked as slow.
+    """
     import pytest  # noqa
 
     test_path = "tests"
     os.environ["ASGI_SERVER"] = server
-    res = pytest.main(
-        ["-v", "--cov=asgineer", "--cov-report=term", "--cov-report=html", test_path]
-    )
+    args = ["-v", "--cov=asgineer", "--cov-report=term", "--cov-report=html"]
+    if parallel:
+        # Each worker is a separate process, and testutils derives the
+        # port and script filename from the pid, so servers don't collide.
+        args += ["-n", "auto"]
+    if fast:
+        args += ["-m", "not slow"]
+    res = pytest.main(args + [test_path])
     if res:
         sys.exit(res)
     if cover:
@@ -4,10 +4,17 @@ Common utilities used in our test scripts.
 
 import os
 import sys
+import asyncio
 
 from asgineer.testutils import ProcessTestServer, MockTestServer
 
 
+# One event loop for all tests. It is set as the current loop, so that
+# asyncio.get_event_loop() returns it instead of creating a new one.
+LOOP = asyncio.new_event_loop()
+asyncio.set_event_loop(LOOP)
+
+
 def get_backend():
     return os.environ.get("ASGI_SERVER", "mock").lower()
 
@@ -18,11 +25,34 @@ def set_backend_from_argv():
             os.environ["ASGI_SERVER"] = arg.split("=")[1].strip().lower()
 
 
+def iter_param_kwargs(func):
+    # Resolve pytest.mark.parametrize marks, so tests can also run as a script
+    kwargs_list = [{}]
+    for mark in getattr(func, "pytestmark", []):
+        if mark.name == "parametrize":
+            names, values = mark.args[:2]
+            if isinstance(names, str):
+                names = [name.strip() for name in names.split(",")]
+            if len(names) == 1:
+                values = [(value,) for value in values]
+            kwargs_list = [
+                dict(kwargs, **dict(zip(names, value)))
+                for kwargs in kwargs_list
+                for value in values
+            ]
+    return kwargs_list
+
+
 def run_tests(scope):
-    for func in list(scope.values()):
-        if callable(func) and func.__name__.startswith("test_"):
-            print(f"Running {func.__name__} ...")
-            func()
+    tests = [
+        (name, func)
+        for name, func in scope.items()
+        if name.startswith("test_") and callable(func)
+    ]
+    for name, func in tests:
+        print(f"Running {name} ...")
+        for kwargs in iter_param_kwargs(func):
+            func(**kwargs)
     print("Done")
 
 
@@ -42,8 +72,8 @@ def filter_lines(lines):
 def make_server(app):
     servername = get_backend()
     if servername.lower() == "mock":
-        server = MockTestServer(app)
+        server = MockTestServer(app, loop=LOOP)
     else:
-        server = ProcessTestServer(app, servername)
+        server = ProcessTestServer(app, servername, loop=LOOP)
     server.filter_lines = filter_lines
     return server
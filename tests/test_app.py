@@ -3,10 +3,11 @@ Test some specifics of the App class.
 """
 
 import logging
-import asyncio
 
 import asgineer
 
+from common import LOOP
+
 
 class LogCapturer(logging.Handler):
     def __init__(self):
@@ -37,9 +38,8 @@ def test_invalid_scope_types():
     app = asgineer.to_asgi(handler)
 
     scope = {"type": "notaknownscope"}
-    loop = asyncio.get_event_loop()
     with LogCapturer() as cap:
-        loop.run_until_complete(app(scope, None, None))
+        LOOP.run_until_complete(app(scope, None, None))
 
     assert len(cap.messages) == 1
     assert "unknown" in cap.messages[0].lower() and "notaknownscope" in cap.messages[0]
@@ -50,7 +50,6 @@ def test_lifespan():
     app = asgineer.to_asgi(handler)
 
     scope = {"type": "lifespan"}
-    loop = asyncio.get_event_loop()
 
     lifespan_messages = [
         {"type": "lifespan.startup"},
@@ -66,7 +65,7 @@ def test_lifespan():
         sent.append(m["type"])
 
     with LogCapturer() as cap:
-        loop.run_until_complete(app(scope, receive, send))
+        LOOP.run_until_complete(app(scope, receive, send))
 
     assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
 
@@ -23,6 +23,10 @@ def test_backend_reporter(capsys=None):
 ## Test normal usage
 
 
+REF_HEADERS = frozenset({"content-type", "content-length", "server", "xx-foo"})
+IGNORE_HEADERS = frozenset({"connection", "date"})  # "optional"
+
+
 async def handler1(request):
     return 200, {"xx-foo": "x"}, "hi!"
 
@@ -57,86 +61,86 @@ async def handler7(request):
     return {"xx-foo": "x"}, "ho!"
 
 
-def test_normal_usage():
+async def handler_normal_usage(request):
+    # Serve handler1-3 from a single server, selected by path
+    handlers = {"/1": handler1, "/2": handler2, "/3": handler3}
+    return await handlers[request.path](request)
 
-    # Test normal usage
 
-    with make_server(handler1) as p:
-        res = p.get("/")
+async def handler_output_shapes(request):
+    # Serve the valid output shapes from a single server, selected by path
+    handlers = {"/4": handler4, "/5": handler5, "/7": handler7}
+    return await handlers[request.path](request)
+
 
-    print(res.status)
-    print(res.headers)
-    print(res.body)
+def test_normal_usage():
+
+    with make_server(handler_normal_usage) as p:
+        res1 = p.get("/1")
+        res2 = p.get("/2")
+        res3 = p.get("/3")
+
+    print(res1.status)
+    print(res1.headers)
+    print(res1.body)
     print(p.out)
 
-    assert res.status == 200
-    assert res.body.decode() == "hi!"
     assert not p.out
 
+    # Test normal usage
+
+    assert res1.status == 200
+    assert res1.body == b"hi!"
+
     # Daphne capitalizes the header keys, hypercorn aims at lowercase
-    headers = set(k.lower() for k in res.headers.keys())
-    refheaders = {"content-type", "content-length", "server", "xx-foo"}
-    ignoreheaders = {"connection", "date"}  # "optional"
-    assert headers.difference(ignoreheaders) == refheaders
-    assert res.headers["content-type"] == "text/plain"
-    assert res.headers["content-length"] == "3"  # yes, a string
+    headers = {k for k, _ in res1.headers.lower_items()}
+    assert headers.difference(IGNORE_HEADERS) == REF_HEADERS
+    assert res1.headers["content-type"] == "text/plain"
+    assert res1.headers["content-length"] == "3"  # yes, a string
 
     # Test delegation to other handler
 
-    with make_server(handler2) as p:
-        res = p.get("/")
-
-    assert res.status == 200
-    assert res.body.decode() == "hi!"
-    assert not p.out
-    assert "xx-foo" in res.headers
+    assert res2.status == 200
+    assert res2.body == b"hi!"
+    assert "xx-foo" in res2.headers
 
     # Test delegation to yet other handler
 
-    with make_server(handler3) as p:
-        res = p.get("/")
-
-    assert res.status == 200
-    assert res.body.decode() == "hi!"
-    assert not p.out
-    assert "xx-foo" in res.headers
+    assert res3.status == 200
+    assert res3.body == b"hi!"
+    assert "xx-foo" in res3.headers
 
 
 def test_output_shapes():
 
-    # Singleton arg
+    with make_server(handler_output_shapes) as p:
+        res4 = p.get("/4")
+        res5 = p.get("/5")
+        res7 = p.get("/7")
 
-    with make_server(handler4) as p:
-        res = p.get("/")
-
-    assert res.status == 200
-    assert res.body.decode() == "ho!"
     assert not p.out
 
-    with make_server(handler5) as p:
-        res = p.get("/")
+    # Singleton arg
 
-    assert res.status == 200
-    assert res.body.decode() == "ho!"
-    assert not p.out
+    assert res4.status == 200
+    assert res4.body == b"ho!"
+
+    assert res5.status == 200
+    assert res5.body == b"ho!"
 
     # Two element tuple (two forms, one is flawed)
 
+    assert res7.status == 200
+    assert res7.body == b"ho!"
+    assert "xx-foo" in res7.headers
+
     with make_server(handler6) as p:
         res = p.get("/")
 
     assert res.status == 500
-    assert "Headers must be a dict" in res.body.decode()
+    assert b"Headers must be a dict" in res.body
     assert "Headers must be a dict" in p.out
 
-    with make_server(handler7) as p:
-        res = p.get("/")
-
-    assert res.status == 200
-    assert res.body.decode() == "ho!"
-    assert not p.out
-    assert "xx-foo" in res.headers
-
 
 def test_body_types():
 
@@ -150,7 +154,7 @@ def test_body_types():
 
     assert res.status == 200
     assert res.headers["content-type"] == "text/plain"
-    assert res.body.decode()
+    assert res.body
     assert not p.out
 
     # Json
@@ -163,7 +167,7 @@ def test_body_types():
 
     assert res.status == 200
     assert res.headers["content-type"] == "application/json"
-    assert json.loads(res.body.decode()) == {"foo": 42, "bar": 7}
+    assert json.loads(res.body) == {"foo": 42, "bar": 7}
     assert not p.out
 
     # Dicts can be non-jsonabe
@@ -175,7 +179,7 @@ def test_body_types():
         res = p.get("/")
 
     assert res.status == 500
-    assert "could not json encode" in res.body.decode().lower()
+    assert b"could not json encode" in res.body.lower()
     assert "could not json encode" in p.out.lower()
 
     # HTML
@@ -191,7 +195,7 @@ def test_body_types():
 
     assert res.status == 200
     assert res.headers["content-type"] == "text/html"
-    assert "foo" in res.body.decode()
+    assert b"foo" in res.body
     assert not p.out
 
     with make_server(handler_html2) as p:
@@ -199,7 +203,7 @@ def test_body_types():
 
     assert res.status == 200
     assert res.headers["content-type"] == "text/html"
-    assert "foo" in res.body.decode()
+    assert b"foo" in res.body
     assert not p.out
 
 
@@ -221,49 +225,76 @@ def test_chunking():
         res = p.get("/")
 
     assert res.status == 200
-    assert res.body.decode() == "foobar"
+    assert res.body == b"foobar"
     assert not p.out
 
-    # Read
+    # Read (a body and an empty body, using the same server)
 
     async def handler_chunkread1(request):
-        body = []
+        body = bytearray()
         async for chunk in request.iter_body():
-            body.append(chunk)
-        return b"".join(body)
+            body += chunk
+        return bytes(body)
 
     with make_server(handler_chunkread1) as p:
-        res = p.post("/", b"foobar")
+        res1 = p.post("/", b"foobar")
+        res2 = p.post("/")
 
-    assert res.status == 200
-    assert res.body.decode() == "foobar"
+    assert res1.status == 200
+    assert res1.body == b"foobar"
+    assert res2.status == 200
+    assert res2.body == b""
     assert not p.out
 
-    # Read empty body
+    # Both
 
     async def handler_chunkread2(request):
-        body = []
-        async for chunk in request.iter_body():
-            body.append(chunk)
-        return b"".join(body)
+        return request.iter_body()  # echo :)
 
     with make_server(handler_chunkread2) as p:
-        res = p.post("/")
+        res = p.post("/", b"foobar")
 
     assert res.status == 200
-    assert res.body.decode() == ""
+    assert res.body == b"foobar"
     assert not p.out
 
-    # Both
 
-    async def handler_chunkread3(request):
-        return request.iter_body()  # echo :)
+def test_chunking_large():
 
-    with make_server(handler_chunkread3) as p:
-        res = p.post("/", b"foobar")
+    # Write
+
+    async def handler_chunkwrite_large(request):
+        async def asynciter():
+            for i in range(16):
+                yield bytes([i]) * 65536
+
+        return 200, {}, asynciter()
+
+    with make_server(handler_chunkwrite_large) as p:
+        res = p.get("/")
+
+    assert res.status == 200
+    assert len(res.body) == 16 * 65536
+    assert res.body == b"".join(bytes([i]) * 65536 for i in range(16))
+    assert not p.out
+
+    # Read (a streamed body, counted without keeping it in memory)
+
+    async def handler_chunkread_large(request):
+        nbytes = 0
+        async for chunk in request.iter_body():
+            nbytes += len(chunk)
+        return str(nbytes)
+
+    def chunk_gen():
+        for i in range(16):
+            yield b"x" * 65536
+
+    with make_server(handler_chunkread_large) as p:
+        res = p.post("/", chunk_gen())
 
     assert res.status == 200
-    assert res.body.decode() == "foobar"
+    assert res.body == str(16 * 65536).encode()
     assert not p.out
 
 
@@ -282,7 +313,7 @@ def test_chunking_fails():
         res = p.get("/")
 
     assert res.status == 500
-    assert "cannot be a regular generator" in res.body.decode().lower()
+    assert b"cannot be a regular generator" in res.body.lower()
     assert "cannot be a regular generator" in p.out.lower()
 
     # Write fail - cannot be (normal or async) func
@@ -297,7 +328,7 @@ def test_chunking_fails():
         res = p.get("/")
 
     assert res.status == 500
-    assert "body cannot be" in res.body.decode().lower()
+    assert b"body cannot be" in res.body.lower()
     assert "body cannot be" in p.out.lower()
 
     # Read fail - cannot iter twice
@@ -314,7 +345,7 @@ def test_chunking_fails():
         res = p.post("/", b"x")
 
     assert res.status == 500
-    assert "already consumed" in res.body.decode().lower()
+    assert b"already consumed" in res.body.lower()
     assert "already consumed" in p.out.lower()
 
     # Read fail - sleep_while_connected consumes data
@@ -330,7 +361,7 @@ def test_chunking_fails():
         res = p.get("/", b"xx")
 
     assert res.status == 500
-    assert "already consumed" in res.body.decode().lower()
+    assert b"already consumed" in res.body.lower()
     assert "already consumed" in p.out.lower()
 
     # Read fail - cannot iter after disconnect
@@ -350,7 +381,7 @@ def test_chunking_fails():
             res = p.post("/", b"x")
 
         assert res.status == 500
-        assert "already disconnected" in res.body.decode().lower()
+        assert b"already disconnected" in res.body.lower()
         assert "already disconnected" in p.out.lower()
 
     # Exceed memory
@@ -368,7 +399,7 @@ def test_chunking_fails():
         res = p.post("/", b"xxxxxxxxxxx")
 
     assert res.status == 500
-    assert "request body too large" in res.body.decode().lower()
+    assert b"request body too large" in res.body.lower()
     assert "request body too large" in p.out.lower()
 
 
@@ -381,13 +412,12 @@ async def handler_err1(request):
 
 async def handler_err2(request):
     raise ValueError("wo" + "ops")
-    return 200, {"xx-custom": "xx"}, "oops"
 
 
 async def handler_err3(request):
     async def chunkiter():
         raise ValueError("wo" + "ops")
-        yield "foo"
+        yield "foo"  # unreachable, but makes this an async generator
 
     return 200, {"xx-custom": "xx"}, chunkiter()
 
@@ -408,7 +438,7 @@ def test_errors():
         res = p.get("/")
 
     assert res.status == 501
-    assert res.body.decode() == "oops"
+    assert res.body == b"oops"
     assert not p.out
     assert "xx-custom" in res.headers
 
@@ -418,9 +448,8 @@ def test_errors():
         res = p.get("/")
 
     assert res.status == 500
-    assert "error in request handler" in res.body.decode().lower()
-    assert "woops" in res.body.decode()
-    assert "woops" in p.out
+    assert b"error in request handler" in res.body.lower()
+    assert b"woops" in res.body
     assert p.out.count("ERROR") == 1
     assert p.out.count("woops") == 2
     assert "xx-custom" not in res.headers
@@ -431,8 +460,8 @@ def test_errors():
         res = p.get("/")
 
     assert res.status == 500
-    assert "error in sending chunked response" in res.body.decode().lower()
-    assert "woops" in res.body.decode()
+    assert b"error in sending chunked response" in res.body.lower()
+    assert b"woops" in res.body
     assert "woops" in p.out and "foo" not in p.out
     assert "xx-custom" not in res.headers
 
@@ -442,7 +471,7 @@ def test_errors():
         res = p.get("/")
 
     assert res.status == 200
-    assert res.body.decode() == "foo"
+    assert res.body == b"foo"
     assert "woops" in p.out
     assert "xx-custom" in res.headers
 
@@ -494,40 +523,39 @@ async def handler_output13(request):
     return handler1(request)  # forgot await
 
 
+async def handler_wrong_header1(request):
+    return 200, {"foo": 3}, b""
+
+
+async def handler_wrong_header2(request):
+    return 200, {b"foo": "bar"}, b""
+
+
+async def handler_wrong_header3(request):
+    return 200, {"foo": b"bar"}, b""
+
+
 def test_wrong_output():
 
     with make_server(handler_output1) as p:
         res = p.get("/")
 
     assert res.status == 500
-    assert "handler returned 4-tuple" in res.body.decode().lower()
+    assert b"handler returned 4-tuple" in res.body.lower()
     assert "handler returned 4-tuple" in p.out.lower()
 
-    for handler in (
-        handler_output2,
-        handler_output3,
-        handler_output6,
-        handler_output13,
-    ):
-        with make_server(handler) as p:
-            res = p.get("/")
-
-        assert res.status == 500
-        assert "body cannot be" in res.body.decode().lower()
-        assert "body cannot be" in p.out.lower()
-
     with make_server(handler_output4) as p:
         res = p.get("/")
 
     assert res.status == 500
-    assert "status code must be an int" in res.body.decode().lower()
+    assert b"status code must be an int" in res.body.lower()
     assert "status code must be an int" in p.out.lower()
 
     with make_server(handler_output5) as p:
         res = p.get("/")
 
     assert res.status == 500
-    assert "headers must be a dict" in res.body.decode().lower()
+    assert b"headers must be a dict" in res.body.lower()
     assert "headers must be a dict" in p.out.lower()
 
     # Chunked
@@ -536,35 +564,46 @@ def test_wrong_output():
         res = p.get("/")
 
     assert res.status == 500
-    assert "error in sending chunked response" in res.body.decode().lower()
-    assert "chunks must be" in res.body.decode().lower()
+    assert b"error in sending chunked response" in res.body.lower()
+    assert b"chunks must be" in res.body.lower()
     assert "chunks must be" in p.out.lower()
 
     with make_server(handler_output12) as p:
         res = p.get("/")
 
     assert res.status == 200  # too late to set status!
-    assert res.body.decode() == "foo"
+    assert res.body == b"foo"
     assert "chunks must be" in p.out.lower()
 
-    # Wrong header
 
-    async def wrong_header1(request):
-        return 200, {"foo": 3}, b""
+@pytest.mark.parametrize(
+    "handler",
+    [handler_output2, handler_output3, handler_output6, handler_output13],
+    ids=lambda handler: handler.__name__,
+)
+def test_wrong_output_body(handler):
 
-    async def wrong_header2(request):
-        return 200, {b"foo": "bar"}, b""
+    with make_server(handler) as p:
+        res = p.get("/")
 
-    async def wrong_header3(request):
-        return 200, {"foo": b"bar"}, b""
+    assert res.status == 500
+    assert b"body cannot be" in res.body.lower()
+    assert "body cannot be" in p.out.lower()
 
-    for handler in (wrong_header1, wrong_header2, wrong_header3):
-        with make_server(handler) as p:
-            res = p.get("/")
 
-        assert res.status == 500
-        assert "header keys and values" in res.body.decode().lower()
-        assert "header keys and values" in p.out.lower()
+@pytest.mark.parametrize(
+    "handler",
+    [handler_wrong_header1, handler_wrong_header2, handler_wrong_header3],
+    ids=lambda handler: handler.__name__,
+)
+def test_wrong_output_header(handler):
+
+    with make_server(handler) as p:
+        res = p.get("/")
+
+    assert res.status == 500
+    assert b"header keys and values" in res.body.lower()
+    assert "header keys and values" in p.out.lower()
 
 
 ## Test using accept and send
@@ -579,7 +618,7 @@ def test_using_accept_and_send():
         res = p.get("/")
 
     assert res.status == 200
-    assert res.body.decode() == "hi!"
+    assert res.body == b"hi!"
     assert not p.out
 
 
@@ -593,7 +632,7 @@ def test_cannot_accept_and_return():
         res = p.get("/")
 
     assert res.status == 200  # Because response has already been sent!
-    assert res.body.decode() == "hi!"
+    assert res.body == b"hi!"
     assert "should return None" in p.out
 
 
@@ -607,7 +646,7 @@ def test_cannot_accept_twice():
         res = p.get("/")
 
     assert res.status == 200  # accept was already sent
-    assert res.body.decode() == ""  # but body was not
+    assert res.body == b""  # but body was not
     assert "cannot accept" in p.out.lower()
 
 
@@ -620,7 +659,7 @@ def test_cannot_send_wrong_objects():
         res = p.get("/")
 
     assert res.status == 200  # accept was already sent
-    assert res.body.decode() == ""
+    assert res.body == b""
     assert "can only send" in p.out.lower()
 
 
@@ -633,7 +672,7 @@ def test_cannot_send_before_accept():
         res = p.get("/")
 
     assert res.status == 500
-    assert "cannot send before" in res.body.decode().lower()
+    assert b"cannot send before" in res.body.lower()
     assert "cannot send before" in p.out.lower()
 
 
@@ -647,7 +686,7 @@ def test_cannot_send_after_closing():
         res = p.get("/")
 
     assert res.status == 200
-    assert res.body.decode() == "hi!"
+    assert res.body == b"hi!"
     assert "cannot send to a closed" in p.out.lower()
 
 
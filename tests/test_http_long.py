@@ -8,8 +8,8 @@ import asyncio
 
 import asgineer
 
-from common import make_server, get_backend
-from pytest import raises, skip
+from common import LOOP, make_server, get_backend
+from pytest import mark, raises, skip
 
 
 def test_stream1():
@@ -17,7 +17,7 @@ def test_stream1():
     async def stream_handler(request):
         async def stream():
             for i in range(10):
-                await asgineer.sleep(0.1)
+                await asgineer.sleep(0.01)
                 yield str(i)
 
         return 200, {}, stream()
@@ -34,7 +34,7 @@ def test_stream2():
     async def stream_handler(request):
         await request.accept(200, {})
         for i in range(10):
-            await asgineer.sleep(0.1)
+            await asgineer.sleep(0.01)
             await request.send(str(i))
 
     with make_server(stream_handler) as p:
@@ -48,7 +48,7 @@ def test_stream3():
     # This is basically long polling
     async def stream_handler(request):
         await request.accept(200, {})
-        await request.sleep_while_connected(1.0)
+        await request.sleep_while_connected(0.1)
         for i in range(10):
             await request.send(str(i))
 
@@ -80,7 +80,7 @@ def test_stream4():
     async def stream_handler(request):
         await request.accept(200, {})
         for i in range(10):
-            await request.sleep_while_connected(0.1)
+            await request.sleep_while_connected(0.01)
             await request.send(str(i))
 
     with make_server(stream_handler) as p:
@@ -100,16 +100,17 @@ def test_stream5():
         }
         await request.accept(200, sse_headers)
         for i in range(10):
-            await request.sleep_while_connected(0.1)
+            await request.sleep_while_connected(0.01)
             await request.send(f"event: message\ndata:{str(i)}\n\n")
 
     with make_server(stream_handler) as p:
         res = p.get("/")
 
-    val = "".join(x.split("data:")[-1] for x in res.body.decode().split("\n\n"))
-    assert val == "0123456789"
+    val = b"".join(x.split(b"data:")[-1] for x in res.body.split(b"\n\n"))
+    assert val == b"0123456789"
 
 
+@mark.slow
 def test_stream_wakeup():
 
     # This tests that the request object has a wakeup (async) method.
@@ -159,8 +160,6 @@ def test_evil_handler():
 
 def test_request_set():
 
-    loop = asyncio.get_event_loop()
-
     s1 = asgineer.RequestSet()
     r1 = asgineer.BaseRequest(None)
     r2 = asgineer.BaseRequest(None)
@@ -193,8 +192,10 @@ def test_request_set():
     assert len(s3) == 0
 
     # Asgineer app does this at the end
-    loop.run_until_complete(r1._destroy())
-    loop.run_until_complete(r2._destroy())
+    async def destroy(*requests):
+        await asyncio.gather(*(r._destroy() for r in requests))
+
+    LOOP.run_until_complete(destroy(r1, r2))
     assert len(s1) == 1
     assert len(s2) == 0
 
@@ -9,7 +9,7 @@ import asgineer
 def test_namespace():
     assert asgineer.__version__
 
-    ns = set(name for name in dir(asgineer) if not name.startswith("_"))
+    ns = {name for name in dir(asgineer) if not name.startswith("_")}
 
     ns.discard("testutils")  # may or may not be imported
 
@@ -34,9 +34,9 @@ def test_newlines():
         for fname in files:
             if fname.endswith((".py", ".md", ".rst", ".yml")):
                 with open(os.path.join(root, fname), "rb") as f:
-                    text = f.read().decode()
-                    assert "\r" not in text, f"{fname} has CR!"
-                    assert "\t" not in text, f"{fname} has tabs!"
+                    text = f.read().decode()  # also checks that it's utf-8
+                assert "\r" not in text, f"{fname} has CR!"
+                assert "\t" not in text, f"{fname} has tabs!"
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@ Test testutils code. Note that most other tests implicitly test it.
 """
 
 from common import make_server
-from asgineer.testutils import MockTestServer
+from asgineer.testutils import MockTestServer, ProcessTestServer
 import asgineer
 
 
@@ -95,13 +95,25 @@ def test_http_mock():
         assert p.get("").body == b"hellow3"
 
 
+def test_handler_source_with_multiline_string():
+    async def handler(request):
+        return """hellow
+multiline"""
+
+    # The source of the handler is extracted for the process servers
+    compile(ProcessTestServer(handler, "uvicorn")._app_code, "<test>", "exec")
+
+    with make_server(handler) as p:
+        assert p.get("").body == b"hellow\nmultiline"
+
+
 def test_lifetime_messages():
     async def handler(request):
         print("xxx")
         return "hellow"
 
     with MockTestServer(handler) as p:
-        assert p.get("").body.decode() == "hellow"
+        assert p.get("").body == b"hellow"
 
     assert len(p.out.strip().splitlines()) == 3
     assert "Server is starting up" in p.out
@@ -109,7 +121,7 @@ def test_lifetime_messages():
     assert "Server is shutting down" in p.out
 
     with make_server(handler) as p:
-        assert p.get("").body.decode() == "hellow"
+        assert p.get("").body == b"hellow"
 
     # todo: somehow the lifetime messages dont show up (on uvicorn) and I dont know why.
 
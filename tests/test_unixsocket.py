@@ -1,3 +1,4 @@
+import sys
 import subprocess
 import tempfile
 import socket
@@ -5,61 +6,91 @@ import time
 import shutil
 from pathlib import Path
 
+import pytest
+
 HTTP_REQUEST = (
-    "GET / HTTP/1.1\r\n" + "Host: example.com\r\n" + "Connection: close\r\n\r\n"
+    b"GET / HTTP/1.1\r\n" + b"Host: example.com\r\n" + b"Connection: close\r\n\r\n"
 )
 
 
-def test_unixsocket():
-    for backend_module in ["hypercorn", "uvicorn", "daphne"]:
-        # mkdtemp instead of normal tempdir to prevent any issues that
-        # might occur with early clean up
-        temp_folder = tempfile.mkdtemp()
-        socket_location = f"{temp_folder}/socket"
-        main_location = f"{temp_folder}/main.py"
-        project_location = Path(__file__).parent.parent.absolute()
-        code_to_run = "\n".join(
-            [
-                "# this allows us not to install asgineer and still import it",
-                "import importlib",
-                "import sys",
-                f"spec = importlib.util.spec_from_file_location('asgineer', '{project_location}/asgineer/__init__.py')",
-                "module = importlib.util.module_from_spec(spec)",
-                "sys.modules[spec.name] = module ",
-                "spec.loader.exec_module(module)",
-                "",
-                "import asgineer",
-                "@asgineer.to_asgi",
-                "async def main(request):",
-                '    return "Ok"',
-                "",
-                "if __name__ == '__main__':",
-                f"    asgineer.run(main, '{backend_module}', 'unix:{socket_location}')",
-            ]
-        )
+def connect_unix(socket_location, process, timeout=10):
+    """Connect to the server's unix socket, retrying with a backoff
+    until it accepts connections.
+    """
+    etime = time.time() + timeout
+    delay = 0.01
+    while True:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(socket_location)
+            return client
+        except (FileNotFoundError, ConnectionRefusedError):
+            client.close()
+        if process.poll() is not None:
+            raise RuntimeError("Server process exited before accepting connections")
+        if time.time() > etime:
+            raise RuntimeError(f"Could not connect to {socket_location}")
+        time.sleep(delay)
+        delay = min(2 * delay, 0.25)
 
-        with open(main_location, "w") as file:
-            file.write(code_to_run)
 
-        process = subprocess.Popen(["python", main_location], cwd=project_location)
+def stop_process(process):
+    """Stop the server process, forcing it to stop if needed."""
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait(5)
 
-        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
-            max_tries = 3
-            for i in range(max_tries):
-                time.sleep(1)
-                try:
-                    client.connect(socket_location)
-                    client.send(HTTP_REQUEST.encode())
 
-                    response = client.recv(1024).decode()
+@pytest.mark.slow
+@pytest.mark.parametrize("backend_module", ["hypercorn", "uvicorn", "daphne"])
+def test_unixsocket(backend_module):
+    pytest.importorskip(backend_module)
 
-                    if "200" in response:
-                        break
-                    else:
-                        raise RuntimeError("Unexpected response")
-                except Exception as e:
-                    print(repr(e))
-                    print(f"Failed {i} times (max: {max_tries}), retrying...")
+    # mkdtemp instead of normal tempdir to prevent any issues that
+    # might occur with early clean up
+    temp_folder = tempfile.mkdtemp()
+    socket_location = f"{temp_folder}/socket"
+    main_location = f"{temp_folder}/main.py"
+    project_location = Path(__file__).parent.parent.absolute()
+    code_to_run = "\n".join(
+        [
+            "# this allows us not to install asgineer and still import it",
+            "import importlib",
+            "import sys",
+            f"spec = importlib.util.spec_from_file_location('asgineer', '{project_location}/asgineer/__init__.py')",
+            "module = importlib.util.module_from_spec(spec)",
+            "sys.modules[spec.name] = module ",
+            "spec.loader.exec_module(module)",
+            "",
+            "import asgineer",
+            "@asgineer.to_asgi",
+            "async def main(request):",
+            '    return "Ok"',
+            "",
+            "if __name__ == '__main__':",
+            "    asgineer.run(main, sys.argv[1], sys.argv[2])",
+        ]
+    )
 
-        process.kill()
-        shutil.rmtree(temp_folder)
+    with open(main_location, "w") as file:
+        file.write(code_to_run)
+
+    process = subprocess.Popen(
+        [sys.executable, main_location, backend_module, f"unix:{socket_location}"],
+        cwd=project_location,
+    )
+
+    try:
+        with connect_unix(socket_location, process) as client:
+            client.send(HTTP_REQUEST)
+            response = client.recv(1024).decode()
+    finally:
+        try:
+            stop_process(process)
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    assert "200" in response
@@ -1,4 +1,4 @@
-import random
+import os
 
 import asgineer.utils
 
@@ -8,7 +8,10 @@ from pytest import raises, skip
 
 
 compressable_data = b"x" * 1000
-uncompressable_data = bytes([int(random.uniform(0, 255)) for i in range(1000)])
+uncompressable_data = os.urandom(1000)
+big_uncompressable_data = os.urandom(100000)
+big_text = "x" * 10000
+big_html = "<html>" + "x" * 100000
 
 # def test_normalize_response()  -> tested as part of test_app
 
@@ -36,7 +39,8 @@ def test_make_asset_handler():
         "foo.png": uncompressable_data,
     }
     assets.update({"b.xx": b"x", "t.xx": "x", "h.xx": "<html>x</html>"})
-    assets.update({"big.html": "x" * 10000, "bightml": "<html>" + "x" * 100000})
+    assets.update({"big.html": big_text, "bightml": big_html})
+    assets.update({"big.png": big_uncompressable_data})
     handler = asgineer.utils.make_asset_handler(assets)
     server = make_server(asgineer.to_asgi(handler))
 
@@ -133,6 +137,29 @@ def test_make_asset_handler():
         assert r.headers["content-type"] == "text/html"
         assert len(r.body) < len(plainbody)
 
+    # Big files that do not compress are not zipped
+    r = server.get("big.png", headers={"accept-encoding": "gzip"})
+    assert r.status == 200
+    assert r.headers.get("content-encoding", "identity") == "identity"
+    assert r.body == big_uncompressable_data
+
+
+def test_may_compress():
+    may_compress = asgineer.utils._may_compress
+    sample_size = 32768
+
+    # Small bodies are not sampled
+    assert may_compress(b"")
+    assert may_compress(uncompressable_data)
+    assert may_compress(os.urandom(4 * sample_size - 1))
+
+    # Large bodies are sampled
+    assert not may_compress(os.urandom(4 * sample_size))
+    assert may_compress(("x" * 4 * sample_size).encode())
+
+    # Repeats within deflate's 32 KiB window are detected
+    assert may_compress(os.urandom(8192) * 32)
+
 
 def test_make_asset_handler_max_age():
     if get_backend() != "mock":
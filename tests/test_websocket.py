@@ -2,111 +2,113 @@
 Test behavior for websocket handlers.
 """
 
-import sys
-
 import asgineer
 from common import make_server, get_backend
 from pytest import skip
 
 
-def test_websocket1():
-
+async def handle_ws_server_close(request):
     # Send messages from server to client
+    await request.accept()
+    await request.send("some text")
+    await request.send(b"some bytes")
+    await request.send({"some": "json"})
+    await request.close()
 
-    async def handle_ws(request):
-        await request.accept()
-        await request.send("some text")
-        await request.send(b"some bytes")
-        await request.send({"some": "json"})
-        await request.close()
 
-    async def client(ws):
-        messages = []
-        async for m in ws:
-            messages.append(m)
-        return messages
+async def handle_ws_client_close(request):
+    # Send messages from server to client, let the client stop
+    await request.accept()
+    await request.send("hi")
+    await request.send("CLIENT_CLOSE")
+    # Wait for client to close connection
+    async for m in request.receive_iter():
+        print(m)
+
+
+async def client_receive_all(ws):
+    messages = []
+    async for m in ws:
+        messages.append(m)
+    return messages
+
+
+async def client_receive_until_close(ws):
+    messages = []
+    async for m in ws:
+        messages.append(m)
+        if m == "CLIENT_CLOSE":
+            break
+    return messages
 
-    with make_server(handle_ws) as p:
-        messages = p.ws_communicate("/", client)
 
-    assert messages == ["some text", b"some bytes", b'{"some": "json"}']
+async def handle_ws_websocket1(request):
+    # Serve both scenarios from a single server, selected by path
+    handlers = {"/1": handle_ws_server_close, "/2": handle_ws_client_close}
+    return await handlers[request.path](request)
+
+
+def test_websocket1():
+
+    with make_server(handle_ws_websocket1) as p:
+        messages1 = p.ws_communicate("/1", client_receive_all)
+        messages2 = p.ws_communicate("/2", client_receive_until_close)
+
     assert not p.out
 
+    # Send messages from server to client
+
+    assert messages1 == ["some text", b"some bytes", b'{"some": "json"}']
+
     # Send messages from server to client, let the client stop
 
-    async def handle_ws(request):
-        await request.accept()
-        await request.send("hi")
-        await request.send("CLIENT_CLOSE")
-        # Wait for client to close connection
-        async for m in request.receive_iter():
-            print(m)
+    assert messages2 == ["hi", "CLIENT_CLOSE"]
 
-    async def client(ws):
-        messages = []
-        async for m in ws:
-            messages.append(m)
-            if m == "CLIENT_CLOSE":
-                break
-        return messages
 
-    with make_server(handle_ws) as p:
-        messages = p.ws_communicate("/", client)
+async def handle_ws_print_all(request):
+    # Print all messages from the client
+    await request.accept()
+    async for m in request.receive_iter():
+        print(m)
 
-    assert messages == ["hi", "CLIENT_CLOSE"]
-    assert not p.out
 
+async def handle_ws_print_until_stop(request):
+    # Print messages from the client, until told to stop
+    await request.accept()
+    async for m in request.receive_iter():
+        print(m)
+        if m == "SERVER_STOP":
+            break
 
-def test_websocket2():
 
-    # Send messages from client to server
+async def client_send_and_close(ws):
+    await ws.send("hi")
+    await ws.send("there")
+    await ws.close()
+    return await client_receive_until_close(ws)
 
-    async def handle_ws(request):
-        await request.accept()
-        async for m in request.receive_iter():
-            print(m)
-        sys.stdout.flush()
 
-    async def client(ws):
-        messages = []
-        await ws.send("hi")
-        await ws.send("there")
-        await ws.close()
-        async for m in ws:
-            messages.append(m)
-            if m == "CLIENT_CLOSE":
-                break
-        return messages
+async def client_send_stop(ws):
+    await ws.send("hi")
+    await ws.send("there")
+    await ws.send("SERVER_STOP")
+    return await client_receive_until_close(ws)
 
-    with make_server(handle_ws) as p:
-        messages = p.ws_communicate("/", client)
+
+def test_websocket2():
+
+    # Send messages from client to server
+
+    with make_server(handle_ws_print_all) as p:
+        messages = p.ws_communicate("/", client_send_and_close)
 
     assert messages == []
     assert p.out == "hi\nthere"
 
     # Send messages from server to client, let the server stop
 
-    async def handle_ws(request):
-        await request.accept()
-        async for m in request.receive_iter():
-            print(m)
-            if m == "SERVER_STOP":
-                break
-        sys.stdout.flush()
-
-    async def client(ws):
-        messages = []
-        await ws.send("hi")
-        await ws.send("there")
-        await ws.send("SERVER_STOP")
-        async for m in ws:
-            messages.append(m)
-            if m == "CLIENT_CLOSE":
-                break
-        return messages
-
-    with make_server(handle_ws) as p:
-        messages = p.ws_communicate("/", client)
+    with make_server(handle_ws_print_until_stop) as p:
+        messages = p.ws_communicate("/", client_send_stop)
 
     assert messages == []
     assert p.out == "hi\nthere\nSERVER_STOP"
@@ -120,7 +122,6 @@ def test_websocket_echo():
                 break
             else:
                 await request.send(m)
-        sys.stdout.flush()
 
     async def client(ws):
         messages = []
@@ -145,7 +146,6 @@ def test_websocket_receive():
         await request.accept()
         print(await request.receive_json())
         print(await request.receive_json())
-        sys.stdout.flush()
 
     async def client(ws):
         await ws.send('{"foo": 3}')
@@ -163,7 +163,6 @@ def test_websocket_cannot_send_after_close1():
         await request.send("foo")  # fine
         async for m in request.receive_iter():
             print(m)
-        sys.stdout.flush()
         await request.send("bar")  # not ok
 
     async def client(ws):
@@ -203,30 +202,26 @@ def test_websocket_cannot_send_after_close2():
     assert "Cannot send to a closed ws" in p.out
 
 
-def test_websocket_receive_too_much():
-    async def handle_ws1(request):
-        await request.accept()
-        async for m in request.receive_iter():
-            print(m)
-        sys.stdout.flush()
+async def handle_ws_receive_twice(request):
+    await request.accept()
+    print(await request.receive())
+    print(await request.receive())
 
-    async def handle_ws2(request):
-        await request.accept()
-        print(await request.receive())
-        print(await request.receive())
-        sys.stdout.flush()
 
-    async def client(ws):
-        await ws.send("hellow")
-        # await ws.close()  # this would be the nice behavior
+async def client_send_once(ws):
+    await ws.send("hellow")
+    # await ws.close()  # this would be the nice behavior
 
-    with make_server(handle_ws1) as p:
-        p.ws_communicate("/", client)
+
+def test_websocket_receive_too_much():
+
+    with make_server(handle_ws_print_all) as p:
+        p.ws_communicate("/", client_send_once)
 
     assert "hellow" == p.out.strip()
 
-    with make_server(handle_ws2) as p:
-        p.ws_communicate("/", client)
+    with make_server(handle_ws_receive_twice) as p:
+        p.ws_communicate("/", client_send_once)
 
     assert "hellow" == p.out  # DisconnectError is not reported
 
@@ -259,7 +254,6 @@ def test_websocket_receive_after_disconnect1():
         await request.accept()
         async for m in request.receive_iter():  # stops at DisconnectedError
             print(m)
-        sys.stdout.flush()
         await request.receive()
 
     async def client(ws):
@@ -278,7 +272,6 @@ def test_websocket_receive_after_disconnect2():
         await request.accept()
         try:
             print(await request.receive())
-            sys.stdout.flush()
             print(await request.receive())
         except asgineer.DisconnectedError:
             pass